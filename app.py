@@ -1,12 +1,32 @@
+import io
 import os
+import re
+import bisect
+import json
 import time
-import whisper
+import asyncio
 import argparse
 import shutil
+import functools
+import multiprocessing
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import httpx
+import litellm
+import numpy as np
 from rich.console import Console
 from dotenv import load_dotenv
-from litellm import completion
-from prompt import PROMPT
+from litellm import acompletion
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
+from cache import ResultCache, SemanticCache
+from prompt import COMBINE_PROMPT, SYSTEM_PROMPT, USER_PROMPT
+from writer import BatchWriter, response_header
 
 # Load environment variables
 load_dotenv(override=True)
@@ -14,8 +34,122 @@ load_dotenv(override=True)
 # Initialize console
 console = Console()
 
-# Load Whisper model
-stt = whisper.load_model("turbo")
+
+# Preferred CTranslate2 compute types per device, fastest first
+COMPUTE_TYPES = {
+    "cuda": ("int8_float16", "int8_bfloat16", "float16", "int8", "float32"),
+    "cpu": ("int8_bfloat16", "int8"),
+}
+
+
+# Decode processes next to Whisper on CPU, where they share cores with its threads
+CPU_DECODE_WORKERS = 2
+
+
+@functools.cache
+def get_device() -> str:
+    """
+    Picks the device Whisper runs on.
+
+    Returns:
+        str: "cuda" when CTranslate2 sees a GPU, otherwise "cpu".
+    """
+    import ctranslate2
+
+    return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+
+
+def decode_workers() -> int:
+    """
+    Sizes the process pool that decodes audio while Whisper runs.
+
+    Returns:
+        int: Every core on GPU, a few on CPU so Whisper keeps the rest.
+    """
+    cores = os.cpu_count() or 4
+    # The transcription server decodes the files itself
+    if stt_url:
+        return 1
+    if get_device() == "cuda":
+        return cores
+    return min(CPU_DECODE_WORKERS, cores)
+
+
+# Load Whisper model lazily so text-only runs never import or load it
+@functools.cache
+def get_stt():
+    """
+    Loads the Whisper model on first use.
+
+    Returns:
+        BatchedInferencePipeline: The batched transcription pipeline.
+    """
+    import audio
+    import ctranslate2
+    from faster_whisper import WhisperModel, BatchedInferencePipeline
+
+    # Use int8 weights with 16-bit activations where the hardware supports them
+    device = get_device()
+    supported = ctranslate2.get_supported_compute_types(device)
+    compute_type = os.environ.get("COMPUTE_TYPE") or next(
+        (
+            compute_type
+            for compute_type in COMPUTE_TYPES[device]
+            if compute_type in supported
+        ),
+        "default",
+    )
+
+    # Load Whisper model behind the batched inference pipeline
+    # faster-whisper uses 4 CPU threads unless told otherwise
+    # On CPU, leave the decode workers their cores
+    cores = os.cpu_count() or 4
+    if device == "cpu":
+        cores = max(1, cores - decode_workers())
+    cpu_threads = int(os.environ.get("CPU_THREADS", cores))
+
+    stt = BatchedInferencePipeline(
+        WhisperModel(
+            "turbo",
+            device=device,
+            compute_type=compute_type,
+            cpu_threads=cpu_threads,
+        )
+    )
+
+    # Compute log-mel features on the GPU when PyTorch can reach it
+    gpu_features = audio.torch is not None and audio.torch.cuda.is_available()
+    if device == "cuda" and gpu_features:
+        stt.model.feature_extractor = audio.TorchFeatureExtractor.from_extractor(
+            stt.model.feature_extractor
+        )
+
+    return stt
+
+
+# Audio file extensions picked up from the input folder
+AUDIO_EXT = (".wav", ".mp3", ".m4a", ".flac", ".ogg")
+
+# Number of 30-second chunks decoded together per batch
+batch_size = int(os.environ.get("WHISPER_BATCH_SIZE", 16))
+
+# Beam width for Whisper decoding, 1 is greedy search
+beam_size = int(os.environ.get("BEAM_SIZE", 1))
+
+# Number of audio files whose chunks are batched together
+files_per_batch = int(os.environ.get("FILE_BATCH_SIZE", 8))
+
+# Total audio length in seconds a batch may hold, so memory stays flat on long recordings
+batch_seconds = float(os.environ.get("BATCH_SECONDS", 1800))
+
+# Skip silence with Silero VAD before transcribing, overridden by --vad/--no-vad
+use_vad = os.environ.get("VAD", "1") != "0"
+
+# Optional JSONL file receiving per-file timings
+timings_log = os.environ.get("TIMINGS_LOG")
+
+# Transcription server that keeps the model loaded, see serve.py
+stt_url = os.environ.get("STT_URL")
 
 # Get API key and model
 api_key = os.environ.get("API_KEY")
@@ -23,104 +157,518 @@ api_model = os.environ.get("LLM_MODEL")
 api_version = os.environ.get("API_VERSION")
 api_base_url = os.environ.get("LLM_URL")
 
-def get_llm_response(text: str) -> str:
+# Reuse keep-alive HTTP/2 connections across LLM calls instead of a new TLS handshake each time
+http_limits = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+litellm.client_session = httpx.Client(http2=True, limits=http_limits, timeout=120)
+litellm.aclient_session = httpx.AsyncClient(http2=True, limits=http_limits, timeout=120)
+
+# Split the user prompts around the transcript once instead of formatting per call
+def split_prompt(template: str) -> tuple:
     """
-    Generates a response to the given text using LiteLLM.
+    Splits a prompt template around its {text} placeholder.
+
+    Args:
+        template (str): The prompt template.
+
+    Returns:
+        tuple: The text before and after the placeholder.
+    """
+    try:
+        prefix, suffix = template.split("{text}", 1)
+    except ValueError:
+        prefix, suffix = template, ""
+    return prefix, suffix
+
+
+prompt_prefix, prompt_suffix = split_prompt(USER_PROMPT)
+combine_prompt = split_prompt(COMBINE_PROMPT)
+
+# Longer transcripts are summarized in parts of at most this many tokens
+chunk_tokens = int(os.environ.get("CHUNK_TOKENS", 3000))
+
+# Cache of earlier LLM responses, matching similar texts only when a threshold is set
+semantic_threshold = os.environ.get("SEMANTIC_CACHE_THRESHOLD")
+# Responses are only reused for the same model and prompts
+llm_cache = SemanticCache(
+    threshold=float(semantic_threshold) if semantic_threshold else None,
+    namespace="\n".join((str(api_model), SYSTEM_PROMPT, USER_PROMPT)),
+)
+
+# On-disk cache of transcriptions and responses keyed by audio content
+result_cache = ResultCache()
+
+# Maximum number of LLM requests in flight at once
+llm_concurrency = int(os.environ.get("LLM_CONCURRENCY", 8))
+
+# One request limit per event loop, shared by every file and transcript part
+llm_semaphores = weakref.WeakKeyDictionary()
+
+
+def llm_semaphore() -> asyncio.Semaphore:
+    """
+    Returns the semaphore bounding LLM requests on the running event loop.
+
+    Returns:
+        asyncio.Semaphore: A semaphore with llm_concurrency slots.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in llm_semaphores:
+        llm_semaphores[loop] = asyncio.Semaphore(llm_concurrency)
+    return llm_semaphores[loop]
+
+@functools.cache
+def get_encoding():
+    """
+    Loads the tokenizer used to measure transcript length.
+    """
+    import tiktoken
+
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def split_text(text: str, max_tokens: int) -> list:
+    """
+    Splits text on sentence boundaries into parts of at most max_tokens tokens.
+
+    Sentences longer than max_tokens are cut at token boundaries.
+
+    Args:
+        text (str): The text to split.
+        max_tokens (int): Maximum number of tokens per part.
+
+    Returns:
+        list: The parts, in order.
+    """
+    # cl100k never produces more tokens than bytes, so short texts skip the tokenizer
+    if len(text.encode()) <= max_tokens:
+        return [text]
+
+    encoding = get_encoding()
+    if len(encoding.encode(text)) <= max_tokens:
+        return [text]
+
+    parts = []
+    current = []
+    current_tokens = 0
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        tokens = encoding.encode(sentence)
+        if current and current_tokens + len(tokens) > max_tokens:
+            parts.append(" ".join(current))
+            current = []
+            current_tokens = 0
+
+        if len(tokens) > max_tokens:
+            for i in range(0, len(tokens), max_tokens):
+                parts.append(encoding.decode(tokens[i : i + max_tokens]))
+            continue
+
+        current.append(sentence)
+        current_tokens += len(tokens)
+
+    if current:
+        parts.append(" ".join(current))
+    return parts
+
+
+def build_messages(text: str, prompt: tuple = None) -> list:
+    """
+    Builds the chat messages for the given text.
+
+    The instructions form a static system message and the text is appended
+    last, so providers can cache the shared prompt prefix across calls.
 
     Args:
         text (str): The input text to be processed.
+        prompt (tuple, optional): Prefix and suffix around the text. Defaults to the transcript prompt.
+
+    Returns:
+        list: The chat messages.
+    """
+    prefix, suffix = prompt or (prompt_prefix, prompt_suffix)
+    system_message = {"role": "system", "content": SYSTEM_PROMPT}
+
+    # Anthropic only caches prompt prefixes that are explicitly marked
+    if api_model and "claude" in api_model:
+        system_message["content"] = [
+            {
+                "type": "text",
+                "text": SYSTEM_PROMPT,
+                "cache_control": {"type": "ephemeral"},
+            }
+        ]
+
+    user_message = {"role": "user", "content": prefix + text + suffix}
+    return [system_message, user_message]
+
+
+@retry(
+    wait=wait_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception_type(
+        (
+            litellm.RateLimitError,
+            litellm.APIConnectionError,
+            litellm.InternalServerError,
+        )
+    ),
+    reraise=True,
+)
+async def stream_completion(messages: list, stream_to=None, offset: int = 0) -> str:
+    """
+    Streams a chat completion, retrying transient failures with exponential backoff.
+
+    Args:
+        messages (list): The chat messages.
+        stream_to (file, optional): Text file the response is written to as it arrives.
+        offset (int, optional): Position in stream_to where the response starts.
 
     Returns:
         str: The generated response.
     """
-    response = completion(
+    # Drop whatever a failed attempt already wrote
+    if stream_to is not None:
+        stream_to.seek(offset)
+        stream_to.truncate()
+
+    response = await acompletion(
         model=api_model,
-        messages=[{"role": "user", "content": PROMPT.format(text=text)}],
+        messages=messages,
         api_base=api_base_url,
         api_key=api_key,
-        api_version=api_version
+        api_version=api_version,
+        stream=True,
     )
-    
-    # Extract the response content
-    return response.choices[0].message.content.strip()
+
+    parts = []
+    async for chunk in response:
+        delta = chunk.choices[0].delta.content
+        if not parts and delta:
+            delta = delta.lstrip()
+        if delta:
+            parts.append(delta)
+            if stream_to is not None:
+                stream_to.write(delta)
+
+    return "".join(parts).strip()
+
+
+async def cached_completion(text: str, stream_to=None, prompt: tuple = None) -> str:
+    """
+    Generates a response with LiteLLM unless the semantic cache already has one.
+
+    Args:
+        text (str): The input text to be processed.
+        stream_to (file, optional): Text file the response is written to as it arrives.
+        prompt (tuple, optional): Prefix and suffix around the text. Defaults to the transcript prompt.
+
+    Returns:
+        str: The generated response.
+    """
+    # Other prompts are keyed with their wording so they never match a plain transcript
+    key = text if prompt is None else prompt[0] + text + prompt[1]
+
+    # Reuse the response of an identical or near-identical earlier text
+    # Embedding and SQLite run in a thread so in-flight streams keep flowing
+    cached = await asyncio.to_thread(llm_cache.get, key)
+    if cached is not None:
+        if stream_to is not None:
+            stream_to.write(cached)
+        return cached
+
+    offset = stream_to.tell() if stream_to is not None else 0
+    try:
+        async with llm_semaphore():
+            content = await stream_completion(
+                build_messages(text, prompt), stream_to, offset
+            )
+    except Exception:
+        llm_cache.discard(key)
+        raise
+
+    await asyncio.to_thread(llm_cache.add, key, content)
+    return content
+
+
+async def get_llm_response(text: str, stream_to=None) -> str:
+    """
+    Generates a response to the given text using LiteLLM.
+
+    Texts longer than chunk_tokens are summarized part by part in parallel,
+    then the partial summaries are combined in one final call.
+
+    Args:
+        text (str): The input text to be processed.
+        stream_to (file, optional): Text file the response is written to as it arrives.
+
+    Returns:
+        str: The generated response.
+    """
+    parts = split_text(text, chunk_tokens)
+    if len(parts) == 1:
+        return await cached_completion(text, stream_to)
+
+    summaries = await asyncio.gather(*(cached_completion(part) for part in parts))
+    return await cached_completion("\n\n".join(summaries), stream_to, combine_prompt)
 
 
 # Define function to transcribe audio
-def transcribe(audio_file) -> str:
+def transcribe(audio_files, executor=None) -> list:
     """
-    Transcribes the given audio file using Whisper.
+    Transcribes the given audio, on the transcription server if one is configured.
 
     Args:
-        audio_file (str): Path to the audio file.
+        audio_files (list): Paths to audio files, or arrays of 16 kHz samples.
+        executor (Executor, optional): Pool used to decode the files locally.
 
     Returns:
-        str: The transcribed text.
+        list: The transcribed text of each item, in the same order.
     """
-    result = stt.transcribe(audio_file, fp16=False, language="id")  # Set fp16=True if using a GPU
-    return result["text"].strip()
+    # The server only reads files, so in-memory audio is transcribed here
+    in_memory = any(isinstance(audio_file, np.ndarray) for audio_file in audio_files)
+    if not stt_url or in_memory:
+        return transcribe_local(audio_files, executor)
 
+    # The server may run from another directory, so send absolute paths
+    # Send the VAD setting too, so --vad/--no-vad applies on the server
+    response = httpx.post(
+        f"{stt_url}/transcribe",
+        json={
+            "paths": [os.path.abspath(audio_file) for audio_file in audio_files],
+            "vad": use_vad,
+        },
+        timeout=None,
+    )
+    response.raise_for_status()
+    return response.json()["transcriptions"]
 
-def transcribe_mel(audio_tensor):
-    options = whisper.DecodingOptions(language="id")
-    result = whisper.decode(stt, audio_tensor, options)
-    text = result.text.strip()
-    return text
 
-def process_audio_file(file_path):
+def speech_loader(vad: bool = None):
+    """
+    Returns the picklable decode and VAD function used for local transcription.
+
+    Args:
+        vad (bool, optional): Skip non-speech with Silero VAD. Defaults to use_vad.
+
+    Returns:
+        functools.partial: audio.load_speech with the VAD setting applied.
+    """
+    import audio
+
+    return functools.partial(audio.load_speech, vad=use_vad if vad is None else vad)
+
+
+def transcribe_local(audio_files, executor=None, vad: bool = None) -> list:
+    """
+    Transcribes the given audio files in this process using the batched Whisper pipeline.
+
+    Args:
+        audio_files (list): Paths to audio files, or arrays of 16 kHz samples.
+        executor (Executor, optional): Pool used to decode the files in parallel.
+        vad (bool, optional): Skip non-speech with Silero VAD. Defaults to use_vad.
+
+    Returns:
+        list: The transcribed text of each item, in the same order.
+    """
+    # Decode each file and let Silero VAD cut its speech into 30-second chunks
+    load_map = executor.map if executor is not None else map
+    return transcribe_loaded(list(load_map(speech_loader(vad), audio_files)))
+
+
+def transcribe_loaded(loaded) -> list:
+    """
+    Transcribes decoded audio using the batched Whisper pipeline.
+
+    The files are laid end to end and cut into speech chunks, so chunks from
+    different files share batches instead of each file decoding on its own.
+
+    Args:
+        loaded (list): (samples, chunks) pairs returned by audio.load_speech.
+
+    Returns:
+        list: The transcribed text of each item, in the same order.
+    """
+    import audio
+
+    audios = [samples for samples, _ in loaded]
+
+    # Offset each file's chunks to where the file starts in the combined audio
+    # faster-whisper takes caller-supplied clip timestamps in seconds
+    offsets = []
+    clip_timestamps = []
+    position = 0
+    for samples, chunks in loaded:
+        offset = position / audio.SAMPLING_RATE
+        offsets.append(offset)
+        for chunk in chunks:
+            clip_timestamps.append(
+                {"start": offset + chunk["start"], "end": offset + chunk["end"]}
+            )
+        position += len(samples)
+
+    if not clip_timestamps:
+        return ["" for _ in loaded]
+
+    segments, _ = get_stt().transcribe(
+        np.concatenate(audios),
+        batch_size=batch_size,
+        beam_size=beam_size,
+        language="id",
+        clip_timestamps=clip_timestamps,
+    )
+
+    return assign_segments(segments, offsets)
+
+
+def assign_segments(segments, offsets) -> list:
+    """
+    Groups transcribed segments by the file they came from.
+
+    Chunks never span two files, so a segment's midpoint tells its file.
+
+    Args:
+        segments (iterable): Segments with start and end times in seconds and their text.
+        offsets (list): Start time in seconds of each file in the combined audio.
+
+    Returns:
+        list: The transcribed text of each file, in the same order as offsets.
+    """
+    texts = [[] for _ in offsets]
+    for segment in segments:
+        middle = (segment.start + segment.end) / 2
+        texts[bisect.bisect_right(offsets, middle) - 1].append(segment.text)
+
+    return ["".join(parts).strip() for parts in texts]
+
+
+def warmup(seconds: int = 15):
+    """
+    Runs a silent clip through the Whisper model so later calls skip one-time setup.
+
+    Args:
+        seconds (int, optional): Length of the silent clip. Defaults to 15.
+    """
+    import audio
+
+    silence = np.zeros(seconds * audio.SAMPLING_RATE, dtype=np.float32)
+    segments, _ = get_stt().model.transcribe(
+        silence, beam_size=beam_size, language="id"
+    )
+    list(segments)
+
+
+async def process_audio_file(
+    file_path, transcription=None, transcription_time=None, cache_key=None, writer=None
+):
     """
     Process a single audio file: transcribe it and generate an LLM response.
     
     Args:
         file_path (str): Path to the audio file.
+        transcription (str, optional): Precomputed transcription of the file.
+        transcription_time (float, optional): Time spent producing the transcription.
+        cache_key (str, optional): Precomputed result cache key of the file.
+        writer (BatchWriter, optional): Writer for the output files of the run.
     """
+    # Create output directories if they don't exist
+    if writer is None:
+        with BatchWriter() as writer:
+            return await process_audio_file(
+                file_path, transcription, transcription_time, cache_key, writer
+            )
+
     console.print(f"[cyan]Processing file: {file_path}")
-        
-    # Transcribe with timer
-    start_transcription = time.time()
-    transcription = transcribe(file_path)
-    end_transcription = time.time()
-    transcription_time = end_transcription - start_transcription
 
-    console.print(f"[yellow]Transcription: {transcription}")
-    
-    # Generate response with timer
-    start_response = time.time()
-    response = get_llm_response(transcription)
-    end_response = time.time()
-    response_time = end_response - start_response
-   
-    console.print(f"[cyan]Assistant response: {response}")
-    
-    # Create output directories if they don't exist
-    transcribe_dir = "transcribe"
-    response_dir = "response"
-    
-    os.makedirs(transcribe_dir, exist_ok=True)
-    os.makedirs(response_dir, exist_ok=True)
-    
+    if cache_key is None:
+        cache_key = await asyncio.to_thread(result_cache.key, file_path, api_model)
+
     # Save results with timing information
     base_name = os.path.splitext(os.path.basename(file_path))[0]
 
-    # Save transcription with timing info
-    transcription_path = os.path.join(transcribe_dir, f"{base_name}_transcription.txt")
-    with open(transcription_path, 'w') as f:
-        f.write(f"Transcription Time: {transcription_time:.2f} seconds\n")
-        f.write(transcription)
-    
+    # Skip both stages when this audio was already processed with this model
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        console.print(f"[green]Using cached result for {file_path}")
+        transcription = cached["transcription"]
+        response = cached["response"]
+        transcription_time = response_time = 0.0
+
+        transcription_path, response_path = writer.write_pair(
+            base_name, transcription, response
+        )
+    else:
+        # Transcribe with timer unless the caller already did
+        if transcription is None:
+            start_transcription = time.perf_counter()
+            transcription = (await asyncio.to_thread(transcribe, [file_path]))[0]
+            end_transcription = time.perf_counter()
+            transcription_time = end_transcription - start_transcription
+
+        console.print(f"[yellow]Transcription: {transcription}")
+
+        # Save transcription with timing info
+        transcription_path = writer.write_transcription(
+            base_name, transcription, transcription_time
+        )
+
+        # Stream the response into its file, then fill in the timing header
+        response_path = writer.response_path(base_name)
+        try:
+            with open(response_path, 'w', encoding='utf-8') as f:
+                f.write(response_header(0.0))
+                start_response = time.perf_counter()
+                response = await get_llm_response(transcription, stream_to=f)
+                end_response = time.perf_counter()
+                response_time = end_response - start_response
+
+                f.seek(0)
+                f.write(response_header(response_time))
+        except Exception:
+            os.remove(response_path)
+            raise
+
+        console.print(f"[cyan]Assistant response: {response}")
+        result_cache.put(cache_key, transcription, response)
+
+    writer.record(base_name, transcription_time, response_time)
     console.print(f"[green]Transcription saved to {transcription_path}")
-    
-    # Save response with timing info
-    response_path = os.path.join(response_dir, f"{base_name}_response.txt")
-    with open(response_path, 'w') as f:
-        f.write(f"Response Generation Time: {response_time:.2f} seconds\n")
-        f.write(response)
-    
     console.print(f"[green]Response saved to {response_path}")
 
+    if timings_log:
+        log_timings(file_path, transcription_time, response_time)
+
+
+def log_timings(file_path, transcription_time, response_time):
+    """
+    Appends the timings of a processed file to the JSONL timings log.
+
+    Args:
+        file_path (str): Path to the audio file.
+        transcription_time (float): Time spent transcribing, in seconds.
+        response_time (float): Time spent generating the response, in seconds.
+    """
+    # The log is diagnostic only, so a failure here must not fail the file
+    try:
+        # Read the duration from the container header with PyAV directly, so
+        # runs served entirely from the cache never import faster-whisper
+        import av
+
+        with av.open(file_path) as container:
+            duration = container.duration
+        record = {
+            "file": file_path,
+            "transcribe_s": round(transcription_time, 3),
+            "llm_s": round(response_time, 3),
+            "audio_s": None if duration is None else duration / av.time_base,
+        }
+        with open(timings_log, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+    except Exception as e:
+        console.print(f"[red]Error logging timings for {file_path}: {str(e)}")
+
 
 def process_folder(folder_path, output_dir=None):
     """
-    Process all .wav files in a folder.
+    Process all audio files in a folder.
     
     Args:
         folder_path (str): Path to the folder containing audio files
@@ -134,58 +682,251 @@ def process_folder(folder_path, output_dir=None):
     archive_dir = "archives"
     os.makedirs(archive_dir, exist_ok=True)
 
-    # Get all .wav files in the folder
-    wav_files = [os.path.join(folder_path, f) for f in os.listdir(folder_path) 
-                if f.lower()]
+    # Get all audio files in the folder, in a stable order
+    with os.scandir(folder_path) as entries:
+        wav_files = sorted(
+            entry.path
+            for entry in entries
+            if entry.is_file() and entry.name.lower().endswith(AUDIO_EXT)
+        )
     
     if not wav_files:
-        console.print(f"[yellow]No .wav files found in {folder_path}")
+        console.print(f"[yellow]No audio files found in {folder_path}")
         return
         
-    console.print(f"[blue]Found {len(wav_files)} .wav files in {folder_path}")
-    
+    console.print(f"[blue]Found {len(wav_files)} audio files in {folder_path}")
     
-    # Process each file
-    for file_path in wav_files:
-        if not os.path.exists(file_path):
-            console.print(
-                f"[red]ERROR: File {file_path} does not exist!  "
-                "Skipping this file."
-            )
-            continue  # Skip to the next file
+    # Keep one buffered summary open for the whole run
+    summary_path = os.path.join("response", "audio_processing_summary.txt")
+    with BatchWriter(summary_path=summary_path) as writer:
+        asyncio.run(process_files(wav_files, archive_dir, writer))
+
+    console.print(f"[green]Summary saved to {summary_path}")
+
+
+async def process_files(wav_files, archive_dir, writer):
+    """
+    Transcribe audio files in batches while their LLM requests run concurrently.
 
+    Args:
+        wav_files (list): Paths to the audio files.
+        archive_dir (str): Directory the files are moved to once processed.
+        writer (BatchWriter): Writer for the output files of the run.
+    """
+    queue = asyncio.Queue()
+
+    async def produce():
         try:
-            process_audio_file(file_path)
+            # Decode audio on every core while Whisper and the LLM calls run
+            # Spawned workers do not inherit CUDA, asyncio or httpx threads
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(decode_workers(), mp_context=context) as pool:
+                await transcribe_pending(pending_batches(), pool)
+        finally:
+            # Signal that no more files are coming, even if the producer failed
+            await queue.put(None)
 
-            # Move the file to the archive directory after processing
-            file_name = os.path.basename(file_path)
-            archive_path = os.path.join(archive_dir, file_name)
+    async def pending_batches():
+        import audio
 
-            # Handle case where a file with the same name might exist in the archive
-            if os.path.exists(archive_path):
-                base, ext = os.path.splitext(file_name)
-                archive_path = os.path.join(archive_dir, f"{base}_{int(time.time())}{ext}")
-            
-            shutil.move(file_path, archive_path)
-            console.print(f"[green]Moved {file_name} to archive folder")
+        # Hash files a batch at a time so transcription starts right away
+        batch = []
+        seconds = 0.0
+        for file_path in wav_files:
+            try:
+                cache_key = await asyncio.to_thread(
+                    result_cache.key, file_path, api_model
+                )
+                cached = result_cache.get(cache_key)
+                if cached is None:
+                    duration = await asyncio.to_thread(audio.get_duration, file_path)
+            except Exception as e:
+                console.print(f"[red]Error reading {file_path}: {str(e)}")
+                continue
+
+            # Cached files skip transcription and go straight to the writers
+            if cached is not None:
+                await queue.put((file_path, None, None, cache_key))
+                continue
+
+            # Bound batches by audio length as well as file count
+            # A file without a known duration gets a batch of its own
+            duration = batch_seconds if duration is None else duration
+            if batch and seconds + duration > batch_seconds:
+                yield batch
+                batch = []
+                seconds = 0.0
+
+            batch.append((file_path, cache_key))
+            seconds += duration
+            if len(batch) == files_per_batch:
+                yield batch
+                batch = []
+                seconds = 0.0
+
+        if batch:
+            yield batch
+
+    def submit_loads(batch, pool):
+        # The transcription server decodes the files itself
+        if stt_url:
+            return None
+        load_speech = speech_loader()
+        return [
+            asyncio.wrap_future(pool.submit(load_speech, file_path))
+            for file_path, _ in batch
+        ]
+
+    async def transcribe_batch(batch, loads):
+        if loads is None:
+            items = [file_path for file_path, _ in batch]
+            run = transcribe
+        else:
+            items = await asyncio.gather(*loads, return_exceptions=True)
+            run = transcribe_loaded
+
+        # Files that failed to decode are reported and left out of the batch
+        transcriptions = [None] * len(batch)
+        ready = []
+        for index, ((file_path, _), item) in enumerate(zip(batch, items)):
+            if isinstance(item, Exception):
+                console.print(f"[red]Error decoding {file_path}: {str(item)}")
+            else:
+                ready.append(index)
+        if not ready:
+            return transcriptions
+
+        # Keep the event loop free for LLM requests while Whisper runs
+        try:
+            texts = await asyncio.to_thread(run, [items[index] for index in ready])
+        except Exception as e:
+            console.print(f"[red]Error transcribing batch: {str(e)}")
+            texts = []
+            for index in ready:
+                # Retry one by one so a single bad file does not sink the rest
+                try:
+                    texts.append((await asyncio.to_thread(run, [items[index]]))[0])
+                except Exception as e:
+                    console.print(f"[red]Error transcribing {batch[index][0]}: {str(e)}")
+                    texts.append(None)
+
+        for index, text in zip(ready, texts):
+            transcriptions[index] = text
+        return transcriptions
+
+    async def next_batch(batches, pool):
+        batch = await anext(batches, None)
+        return batch, submit_loads(batch, pool) if batch else None
+
+    async def transcribe_pending(batches, pool):
+        # Hash and decode the next batch while Whisper transcribes the current one
+        upcoming = asyncio.create_task(next_batch(batches, pool))
+        try:
+            while True:
+                batch, loads = await upcoming
+                if batch is None:
+                    break
+                upcoming = asyncio.create_task(next_batch(batches, pool))
+
+                # Pay model load and kernel setup before the first timed batch
+                if not stt_url and not get_stt.cache_info().currsize:
+                    await asyncio.to_thread(warmup)
+
+                start_transcription = time.perf_counter()
+                transcriptions = await transcribe_batch(batch, loads)
+
+                # The files are decoded together, so each gets an equal share of the time
+                transcription_time = (
+                    time.perf_counter() - start_transcription
+                ) / len(batch)
+
+                for (file_path, cache_key), transcription in zip(
+                    batch, transcriptions
+                ):
+                    if transcription is not None:
+                        await queue.put(
+                            (file_path, transcription, transcription_time, cache_key)
+                        )
+        finally:
+            upcoming.cancel()
 
+    async def respond(file_path, transcription, transcription_time, cache_key):
+        # LLM requests wait for a slot of the shared llm_semaphore
+        try:
+            await process_audio_file(
+                file_path, transcription, transcription_time, cache_key, writer
+            )
+            archive_file(file_path, archive_dir)
         except Exception as e:
             console.print(f"[red]Error processing {file_path}: {str(e)}")
 
-def process_text_for_response(text, output_dir=None):
+    producer = asyncio.create_task(produce())
+    tasks = []
+    while (item := await queue.get()) is not None:
+        tasks.append(asyncio.create_task(respond(*item)))
+
+    # Finish the files already queued before surfacing a producer failure
+    await asyncio.gather(*tasks)
+    await producer
+
+
+def archive_file(file_path, archive_dir):
+    """
+    Move a processed file into the archive directory.
+
+    Args:
+        file_path (str): Path to the processed file.
+        archive_dir (str): Directory to move the file to.
+    """
+    file_name = os.path.basename(file_path)
+    base, ext = os.path.splitext(file_name)
+    archive_path = os.path.join(archive_dir, file_name)
+
+    # Claim the archive name atomically, falling back to timestamped names
+    # while a file with the same name already exists in the archive
+    attempt = 0
+    while True:
+        try:
+            os.close(os.open(archive_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            attempt += 1
+            suffix = f"_{attempt}" if attempt > 1 else ""
+            archive_path = os.path.join(
+                archive_dir, f"{base}_{int(time.time())}{suffix}{ext}"
+            )
+
+    # A rename is a single syscall when the archive is on the same filesystem
+    try:
+        try:
+            os.replace(file_path, archive_path)
+        except OSError:
+            shutil.move(file_path, archive_path)
+    except Exception:
+        # Drop the empty placeholder so it does not look like an archived file
+        try:
+            os.remove(archive_path)
+        except OSError:
+            pass
+        raise
+    console.print(f"[green]Moved {file_name} to archive folder")
+
+async def process_text_for_response(text, output_dir=None, base_name=None):
     """
     Process a text input and generate an LLM response.
     
     Args:
         text (str): The input text.
         output_dir (str, optional): Directory to save response file.
+        base_name (str, optional): Name of the text file without extension. Without it the
+            response is saved as "response.txt".
     """
     console.print(f"[cyan]Processing text: {text}")
     
     # Generate response with timer
-    start_response = time.time()
-    response = get_llm_response(text)
-    end_response = time.time()
+    start_response = time.perf_counter()
+    response = await get_llm_response(text)
+    end_response = time.perf_counter()
     response_time = end_response - start_response
     
     console.print(f"[cyan]Assistant response: {response}")
@@ -195,37 +936,35 @@ def process_text_for_response(text, output_dir=None):
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
         
-        # Save response to a file
-        response_path = os.path.join(output_dir, "response.txt")
-        with open(response_path, 'w') as f:
-            f.write(f"Response Generation Time: {response_time:.2f} seconds\n")
-            f.write(response)
+        # Save response to a file named after its input, if there is one
+        file_name = f"{base_name}_response.txt" if base_name else "response.txt"
+        response_path = os.path.join(output_dir, file_name)
+        Path(response_path).write_text(
+            response_header(response_time) + response, encoding='utf-8'
+        )
         
         console.print(f"[green]Response saved to {response_path}")
 
 
-# Define function to process text files for response generation
-def process_text_files(file_paths, output_dir=None):
+async def process_text_paths(file_paths, output_dir=None):
     """
-    Process specific text files and generate LLM responses for them.
-    
+    Generate LLM responses for text files concurrently.
+
     Args:
         file_paths (list): List of text file paths.
         output_dir (str, optional): Directory to save response files.
+
+    Returns:
+        list: A (file_path, text) tuple per file, or None for files that were skipped.
     """
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        
-    results = []
-    
-    for file_path in file_paths:
+    async def process_one(file_path):
         if not os.path.exists(file_path):
             console.print(f"[red]File {file_path} does not exist.")
-            continue
+            return None
             
         if not file_path.lower().endswith('.txt'):
             console.print(f"[yellow]File {file_path} is not a text file. Skipping.")
-            continue
+            return None
             
         try:
             console.print(f"[cyan]Processing text file: {file_path}")
@@ -236,25 +975,51 @@ def process_text_files(file_paths, output_dir=None):
                 
             console.print(f"[yellow]Text content: {text}")
             
-            # Generate response
-            process_text_for_response(text, output_dir)
+            # Generate response, bounded by the shared llm_semaphore
+            base_name = os.path.splitext(os.path.basename(file_path))[0]
+            await process_text_for_response(text, output_dir, base_name)
             
-            results.append((file_path, text))
+            return (file_path, text)
             
         except Exception as e:
             console.print(f"[red]Error processing {file_path}: {str(e)}")
+            return None
+
+    return await asyncio.gather(*[process_one(file_path) for file_path in file_paths])
+
+
+# Define function to process text files for response generation
+def process_text_files(file_paths, output_dir=None):
+    """
+    Process specific text files and generate LLM responses for them.
+    
+    Args:
+        file_paths (list): List of text file paths.
+        output_dir (str, optional): Directory to save response files.
+    """
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        
+    results = [
+        result
+        for result in asyncio.run(process_text_paths(file_paths, output_dir))
+        if result is not None
+    ]
     
     # Save a summary file
     if output_dir and results:
         summary_path = os.path.join(output_dir, "text_processing_summary.txt")
-        with open(summary_path, 'w') as f:
-            f.write(f"Text processing summary\n")
-            f.write(f"Processed at: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Total files processed: {len(results)}\n\n")
-            
-            for file_path, text in results:
-                f.write(f"File: {os.path.basename(file_path)}\n")
-                f.write(f"Text: {text}\n\n")
+        summary = io.StringIO()
+        summary.write(f"Text processing summary\n")
+        summary.write(f"Processed at: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        summary.write(f"Total files processed: {len(results)}\n\n")
+        
+        for file_path, text in results:
+            summary.write(f"File: {os.path.basename(file_path)}\n")
+            summary.write(f"Text: {text}\n\n")
+        
+        # Flush the whole summary with a single write
+        Path(summary_path).write_text(summary.getvalue(), encoding='utf-8')
                 
         console.print(f"[green]Summary saved to {summary_path}")
     
@@ -267,8 +1032,10 @@ if __name__ == "__main__":
     
     group.add_argument('-a', '--audio', action='store_true', help='Process audio files in the default "inputs" folder')
     group.add_argument('-t', '--text', nargs='+', help='Process specific text files for response generation')
+    parser.add_argument('--vad', action=argparse.BooleanOptionalAction, default=use_vad, help='Skip silence with Silero VAD before transcribing')
     
     args = parser.parse_args()
+    use_vad = args.vad
     
     if args.audio:
         console.print("[cyan]Processing audio files in the default 'inputs' folder.")
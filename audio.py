@@ -0,0 +1,287 @@
+import os
+import av
+import numpy as np
+import soundfile as sf
+from faster_whisper.audio import decode_audio
+from faster_whisper.feature_extractor import FeatureExtractor
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+# Whisper models expect 16 kHz audio
+SAMPLING_RATE = 16000
+
+# Samples read from a WAV file at a time, 30 seconds at 16 kHz
+CHUNK_SAMPLES = 30 * SAMPLING_RATE
+
+
+def wav_data_offset(file_path: str):
+    """
+    Finds where the sample data starts in a RIFF/WAVE file.
+
+    Args:
+        file_path (str): Path to the WAV file.
+
+    Returns:
+        int or None: Byte offset of the "data" chunk payload, or None if it is not found.
+    """
+    with open(file_path, "rb") as f:
+        header = f.read(12)
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return None
+
+        while len(chunk := f.read(8)) == 8:
+            chunk_id, size = chunk[:4], int.from_bytes(chunk[4:], "little")
+            if chunk_id == b"data":
+                return f.tell()
+            # Chunks are padded to an even number of bytes
+            f.seek(size + (size & 1), os.SEEK_CUR)
+
+    return None
+
+
+def load_audio(file_path: str, sampling_rate: int = SAMPLING_RATE) -> np.ndarray:
+    """
+    Loads an audio file as mono float32 samples in [-1, 1].
+
+    16-bit mono WAV files at the target sampling rate are memory-mapped and
+    converted straight from the page cache. Other WAV files at that rate are
+    read with soundfile in 30-second blocks into one preallocated buffer.
+    Everything else goes through faster-whisper's decoder.
+
+    Args:
+        file_path (str): Path to the audio file.
+        sampling_rate (int, optional): The sampling rate to load at. Defaults to 16000.
+
+    Returns:
+        np.ndarray: The audio samples.
+    """
+    if not file_path.lower().endswith(".wav"):
+        return decode_audio(file_path, sampling_rate=sampling_rate)
+
+    with sf.SoundFile(file_path) as f:
+        if f.samplerate != sampling_rate:
+            return decode_audio(file_path, sampling_rate=sampling_rate)
+
+        offset = None
+        if f.format == "WAV" and f.subtype == "PCM_16" and f.channels == 1:
+            offset = wav_data_offset(file_path)
+
+        if offset is None:
+            audio = np.empty(f.frames, dtype=np.float32)
+            position = 0
+            for block in f.blocks(
+                blocksize=CHUNK_SAMPLES, dtype="float32", always_2d=True
+            ):
+                audio[position : position + len(block)] = block.mean(axis=1)
+                position += len(block)
+            return audio[:position]
+
+        frames = f.frames
+
+    pcm = np.memmap(file_path, dtype="<i2", mode="r", offset=offset, shape=(frames,))
+    audio = pcm.astype(np.float32)
+    audio /= 32768.0
+    return audio
+
+
+def speech_chunks(audio: np.ndarray, chunk_length: int = 30) -> list:
+    """
+    Finds speech with Silero VAD, split into chunks no longer than chunk_length.
+
+    Uses the same VAD settings as faster-whisper's batched pipeline.
+
+    Args:
+        audio (np.ndarray): Audio samples at 16 kHz.
+        chunk_length (int, optional): Maximum chunk length in seconds. Defaults to 30.
+
+    Returns:
+        list: Dicts with the "start" and "end" second of each chunk.
+    """
+    vad_options = VadOptions(
+        max_speech_duration_s=chunk_length, min_silence_duration_ms=160
+    )
+    return [
+        {
+            "start": chunk["start"] / SAMPLING_RATE,
+            "end": chunk["end"] / SAMPLING_RATE,
+        }
+        for chunk in get_speech_timestamps(audio, vad_options)
+    ]
+
+
+def fixed_chunks(audio: np.ndarray, chunk_length: int = 30) -> list:
+    """
+    Cuts audio into back-to-back chunks of chunk_length, silence included.
+
+    Args:
+        audio (np.ndarray): Audio samples at 16 kHz.
+        chunk_length (int, optional): Chunk length in seconds. Defaults to 30.
+
+    Returns:
+        list: Dicts with the "start" and "end" second of each chunk.
+    """
+    size = chunk_length * SAMPLING_RATE
+    return [
+        {
+            "start": start / SAMPLING_RATE,
+            "end": min(start + size, len(audio)) / SAMPLING_RATE,
+        }
+        for start in range(0, len(audio), size)
+    ]
+
+
+def compact_speech(samples: np.ndarray, chunks: list) -> tuple:
+    """
+    Keeps only the samples inside the chunks, laid back to back.
+
+    Args:
+        samples (np.ndarray): Audio samples at 16 kHz.
+        chunks (list): Dicts with the "start" and "end" second of each chunk.
+
+    Returns:
+        tuple: The chunk samples and the chunks re-based onto them.
+    """
+    parts = []
+    compact_chunks = []
+    position = 0
+    for chunk in chunks:
+        start = round(chunk["start"] * SAMPLING_RATE)
+        end = round(chunk["end"] * SAMPLING_RATE)
+        parts.append(samples[start:end])
+        compact_chunks.append(
+            {
+                "start": position / SAMPLING_RATE,
+                "end": (position + end - start) / SAMPLING_RATE,
+            }
+        )
+        position += end - start
+
+    if not parts:
+        return np.zeros(0, dtype=np.float32), []
+    return np.concatenate(parts), compact_chunks
+
+
+def load_speech(source, vad: bool = True) -> tuple:
+    """
+    Loads audio and keeps only its speech chunks.
+
+    Kept at module level so it can run in a process pool. Only the chunk
+    samples are returned, so silence is never sent back to the parent.
+
+    Args:
+        source (str, os.PathLike or np.ndarray): Path to an audio file, or 16 kHz samples.
+        vad (bool, optional): Skip non-speech with Silero VAD. Defaults to True.
+
+    Returns:
+        tuple: The speech samples and the list of chunks within them.
+    """
+    if isinstance(source, np.ndarray):
+        samples = source.astype(np.float32, copy=False)
+    else:
+        samples = load_audio(os.fspath(source))
+
+    if not vad:
+        return samples, fixed_chunks(samples)
+    return compact_speech(samples, speech_chunks(samples))
+
+
+def get_duration(file_path: str):
+    """
+    Reads the duration of an audio file from its container header.
+
+    Args:
+        file_path (str): Path to the audio file.
+
+    Returns:
+        float or None: The duration in seconds, or None if the container does not report it.
+    """
+    with av.open(file_path) as container:
+        if container.duration is None:
+            return None
+        return container.duration / av.time_base
+
+
+class TorchFeatureExtractor(FeatureExtractor):
+    def __init__(self, device: str = "cuda", **kwargs):
+        """
+        Initializes the TorchFeatureExtractor class.
+
+        The mel filterbank and the Hann window are uploaded to the device once,
+        so each call is a single STFT followed by one matmul on the accelerator.
+
+        Args:
+            device (str, optional): The device used for feature extraction. Defaults to "cuda".
+            **kwargs: Forwarded to faster-whisper's FeatureExtractor.
+        """
+        super().__init__(**kwargs)
+        self.device = device
+        self.window = torch.hann_window(self.n_fft, device=device)
+        self.mel_filters_device = torch.from_numpy(self.mel_filters).to(device)
+
+    @classmethod
+    def from_extractor(cls, extractor: FeatureExtractor, device: str = "cuda"):
+        """
+        Builds a TorchFeatureExtractor with the same settings as an existing extractor.
+
+        Args:
+            extractor (FeatureExtractor): The extractor loaded with the Whisper model.
+            device (str, optional): The device used for feature extraction. Defaults to "cuda".
+
+        Returns:
+            TorchFeatureExtractor: The device-backed extractor.
+        """
+        return cls(
+            device=device,
+            feature_size=extractor.mel_filters.shape[0],
+            sampling_rate=extractor.sampling_rate,
+            hop_length=extractor.hop_length,
+            chunk_length=extractor.chunk_length,
+            n_fft=extractor.n_fft,
+        )
+
+    def __call__(self, waveform, padding=160, chunk_length=None):
+        """
+        Computes log-mel spectrograms for one waveform or a padded [B, N] batch.
+
+        Args:
+            waveform (np.ndarray): Audio samples at the extractor's sampling rate.
+            padding (int, optional): Number of zero samples appended to the audio. Defaults to 160.
+            chunk_length (int, optional): Overrides the chunk length in seconds.
+
+        Returns:
+            np.ndarray: The log-mel features, shaped [n_mels, T] or [B, n_mels, T].
+        """
+        # Reflect padding needs more samples than half a window
+        if waveform.shape[-1] + padding <= self.n_fft // 2:
+            return super().__call__(waveform, padding, chunk_length)
+
+        if chunk_length is not None:
+            self.n_samples = chunk_length * self.sampling_rate
+            self.nb_max_frames = self.n_samples // self.hop_length
+
+        # No gradients are ever needed, so skip autograd bookkeeping
+        with torch.inference_mode():
+            audio = torch.as_tensor(waveform, dtype=torch.float32).to(self.device)
+            if padding:
+                audio = torch.nn.functional.pad(audio, (0, padding))
+
+            stft = torch.stft(
+                audio,
+                self.n_fft,
+                self.hop_length,
+                window=self.window,
+                return_complex=True,
+            )
+            magnitudes = stft[..., :-1].abs() ** 2
+            mel_spec = self.mel_filters_device @ magnitudes
+
+            log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+            log_spec = torch.maximum(
+                log_spec, log_spec.amax(dim=(-2, -1), keepdim=True) - 8.0
+            )
+            log_spec = (log_spec + 4.0) / 4.0
+            return log_spec.cpu().numpy()
@@ -0,0 +1,274 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import faiss
+import numpy as np
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        path: str = "cache/llm_cache.db",
+        threshold: float = None,
+        model_name: str = "all-MiniLM-L6-v2",
+        window_words: int = 200,
+        namespace: str = "",
+    ):
+        """
+        Initializes the SemanticCache class.
+
+        Responses are looked up by the SHA-1 of the text. When a threshold is
+        given, texts without an exact match are also compared by the cosine
+        similarity of sentence embeddings, so near-duplicate texts reuse an
+        earlier response. Entries live in SQLite and the similarity index is
+        rebuilt from them on first use. Lookups may run in worker threads; a
+        lock serializes them. Entries from another namespace are never
+        returned, so a different model or prompt starts from an empty cache.
+
+        Args:
+            path (str, optional): SQLite database the cache is stored in. Defaults to "cache/llm_cache.db".
+            threshold (float, optional): Minimum cosine similarity and length ratio for a similarity hit. Only exact matches are used if omitted.
+            model_name (str, optional): The sentence-transformers model used for embeddings. Defaults to "all-MiniLM-L6-v2".
+            window_words (int, optional): Words embedded at a time, kept under the model's input limit. Defaults to 200.
+            namespace (str, optional): Identifies what produced the responses, such as the model and prompt. Defaults to "".
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (hash TEXT PRIMARY KEY, "
+            "text TEXT, embedding BLOB, response TEXT, namespace TEXT)"
+        )
+
+        # Rows from before namespaces have none and are never returned
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(responses)")]
+        if "namespace" not in columns:
+            self.db.execute("ALTER TABLE responses ADD COLUMN namespace TEXT")
+
+        self.namespace = hashlib.sha1(namespace.encode()).hexdigest()
+        self.threshold = threshold
+        self.model_name = model_name
+        self.window_words = window_words
+        self.model = None
+        self.index = None
+        self.responses = []
+        self.lengths = []
+        self.embeddings = {}
+
+    def load(self):
+        """
+        Loads the embedding model and rebuilds the similarity index from the database.
+        """
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(self.model_name)
+        self.index = faiss.IndexFlatIP(self.model.get_sentence_embedding_dimension())
+
+        # Rows added while the similarity tier was off have no embedding
+        rows = self.db.execute(
+            "SELECT text, embedding, response FROM responses "
+            "WHERE embedding IS NOT NULL AND namespace = ?",
+            (self.namespace,),
+        ).fetchall()
+        if rows:
+            embeddings = [
+                np.frombuffer(embedding, dtype=np.float32) for _, embedding, _ in rows
+            ]
+            self.index.add(np.stack(embeddings))
+            self.responses = [response for _, _, response in rows]
+            self.lengths = [len(text) for text, _, _ in rows]
+
+    def key(self, text: str) -> str:
+        """
+        Builds the exact-match key of a text within this cache's namespace.
+
+        Args:
+            text (str): The text to key.
+
+        Returns:
+            str: The SHA-1 of the namespace and the text.
+        """
+        return hashlib.sha1((self.namespace + text).encode()).hexdigest()
+
+    def embed(self, text: str) -> np.ndarray:
+        """
+        Embeds the whole text as an L2-normalized vector.
+
+        The model truncates long inputs, so the text is embedded in windows of
+        window_words words and the window embeddings are averaged.
+
+        Args:
+            text (str): The text to embed.
+
+        Returns:
+            np.ndarray: A [1, dim] float32 embedding.
+        """
+        if self.model is None:
+            self.load()
+
+        words = text.split() or [text]
+        windows = [
+            " ".join(words[i : i + self.window_words])
+            for i in range(0, len(words), self.window_words)
+        ]
+        embeddings = self.model.encode(windows, normalize_embeddings=True)
+        embedding = embeddings.mean(axis=0, keepdims=True).astype(np.float32)
+        return embedding / np.linalg.norm(embedding)
+
+    def get(self, text: str):
+        """
+        Looks up the response of an identical or most similar cached text.
+
+        Args:
+            text (str): The text to look up.
+
+        Returns:
+            str or None: The cached response, or None on a miss.
+        """
+        key = self.key(text)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT response FROM responses WHERE hash = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                return row[0]
+
+            if self.threshold is None:
+                return None
+
+            # Keep the embedding so add() does not compute it again
+            embedding = self.embeddings[key] = self.embed(text)
+            if self.index.ntotal == 0:
+                return None
+
+            scores, ids = self.index.search(embedding, 1)
+            score, match = scores[0][0], ids[0][0]
+
+            # Texts of very different length are never the same conversation
+            length = self.lengths[match]
+            length_ratio = min(length, len(text)) / max(length, len(text), 1)
+            if score >= self.threshold and length_ratio >= self.threshold:
+                self.embeddings.pop(key)
+                return self.responses[match]
+            return None
+
+    def add(self, text: str, response: str):
+        """
+        Adds a response to the cache.
+
+        Args:
+            text (str): The text the response was generated for.
+            response (str): The response to cache.
+        """
+        key = self.key(text)
+        with self.lock:
+            embedding = None
+            if self.threshold is not None:
+                embedding = self.embeddings.pop(key, None)
+                if embedding is None:
+                    embedding = self.embed(text)
+
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(hash, text, embedding, response, namespace) VALUES (?, ?, ?, ?, ?)",
+                (
+                    key,
+                    text,
+                    None if embedding is None else embedding.tobytes(),
+                    response,
+                    self.namespace,
+                ),
+            )
+            self.db.commit()
+
+            if embedding is not None:
+                self.index.add(embedding)
+                self.responses.append(response)
+                self.lengths.append(len(text))
+
+    def discard(self, text: str):
+        """
+        Drops the embedding kept by get() for a text that will not be added.
+
+        Args:
+            text (str): The text passed to get().
+        """
+        key = self.key(text)
+        with self.lock:
+            self.embeddings.pop(key, None)
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str = "cache", chunk_size: int = 1 << 20):
+        """
+        Initializes the ResultCache class.
+
+        Transcriptions and responses are stored as JSON records keyed by the
+        SHA-256 of the audio bytes, so re-running a folder skips both stages.
+
+        Args:
+            cache_dir (str, optional): Directory holding the JSON records. Defaults to "cache".
+            chunk_size (int, optional): Bytes read at a time while hashing. Defaults to 1 MiB.
+        """
+        self.cache_dir = cache_dir
+        self.chunk_size = chunk_size
+
+    def key(self, file_path: str, model: str) -> str:
+        """
+        Builds the cache key of an audio file for the given LLM model.
+
+        Args:
+            file_path (str): Path to the audio file.
+            model (str): The LLM model id.
+
+        Returns:
+            str: The cache key.
+        """
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            while chunk := f.read(self.chunk_size):
+                digest.update(chunk)
+
+        # Model ids contain "/" and ":" which are not valid in file names
+        model_name = re.sub(r"[^\w.-]", "_", str(model))
+        return f"{digest.hexdigest()}_{model_name}"
+
+    def get(self, key: str):
+        """
+        Loads a cached record.
+
+        Args:
+            key (str): The cache key returned by key().
+
+        Returns:
+            dict or None: The record with "transcription", "response" and "ts", or None on a miss.
+        """
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, key: str, transcription: str, response: str):
+        """
+        Stores a record in the cache.
+
+        Args:
+            key (str): The cache key returned by key().
+            transcription (str): The transcription of the audio file.
+            response (str): The LLM response to the transcription.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        record = {
+            "transcription": transcription,
+            "response": response,
+            "ts": time.time(),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
@@ -1,10 +1,17 @@
-PROMPT = """
-Berikut adalah transkripsi percakapan telepon. Tolong buatkan ringkasan yang terstruktur yang mencakup:
+SYSTEM_PROMPT = """
+Anda akan menerima transkripsi percakapan telepon. Tolong buatkan ringkasan yang terstruktur yang mencakup:
 - Pihak yang terlibat dalam percakapan
 - Topik utama yang dibahas
 - Poin-poin penting dari percakapan
 - Kesimpulan atau tindak lanjut yang disepakati
+"""
 
-[Tempel transkripsi percakapan di sini]
+USER_PROMPT = """Transkripsi:
+{text}
+"""
+
+COMBINE_PROMPT = """Berikut adalah ringkasan dari beberapa bagian berurutan dari satu transkripsi yang sama. Gabungkan menjadi satu ringkasan yang utuh tanpa mengulang poin yang sama.
+
+Ringkasan bagian:
 {text}
 """
\ No newline at end of file
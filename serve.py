@@ -0,0 +1,48 @@
+import os
+import threading
+import uvicorn
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from pydantic import BaseModel
+from app import console, transcribe_local, warmup
+
+# Whisper runs one request at a time; concurrent requests wait their turn
+stt_lock = threading.Lock()
+
+
+class TranscribeRequest(BaseModel):
+    paths: list[str]
+    vad: bool | None = None
+
+
+@asynccontextmanager
+async def lifespan(server: FastAPI):
+    """
+    Loads and warms up the Whisper model before the server accepts requests.
+    """
+    console.print("[cyan]Loading and warming up the Whisper model...")
+    warmup()
+    console.print("[green]Whisper model ready.")
+    yield
+
+
+server = FastAPI(lifespan=lifespan)
+
+
+@server.post("/transcribe")
+def transcribe_files(request: TranscribeRequest) -> dict:
+    """
+    Transcribes audio files that are readable from the server.
+
+    Args:
+        request (TranscribeRequest): Paths to the audio files and the client's VAD setting.
+
+    Returns:
+        dict: The transcribed text of each file under "transcriptions".
+    """
+    with stt_lock:
+        return {"transcriptions": transcribe_local(request.paths, vad=request.vad)}
+
+
+if __name__ == "__main__":
+    uvicorn.run(server, host="127.0.0.1", port=int(os.environ.get("STT_PORT", 8000)))
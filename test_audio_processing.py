@@ -1,10 +1,31 @@
+import io
+import json
+import wave
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import unittest
-from unittest.mock import patch, MagicMock
-from app import get_llm_response, transcribe, process_audio_file
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock
+import numpy as np
+import soundfile as sf
+import app
+import audio
+from app import (
+    assign_segments,
+    get_llm_response,
+    split_text,
+    transcribe,
+    transcribe_loaded,
+    process_audio_file,
+)
+import faiss
+from cache import ResultCache, SemanticCache
+from writer import BatchWriter, response_header, transcription_header
 import os
-import whisper
 from rich.console import Console
 from dotenv import load_dotenv
+from tenacity import wait_none
 
 # Load environment variables
 load_dotenv()
@@ -12,47 +33,441 @@ load_dotenv()
 # Initialize console
 console = Console()
 
-# Load Whisper model
-stt = whisper.load_model("turbo")
-
 # Get API key and model
 api_key = os.environ.get("OPENROUTER_API_KEY")
 api_model = os.environ.get("LLM_MODEL")
 
+# Sample audio used by the tests that run Whisper
+audio_file_path = "sample/Podcast-Terpendek-di-Dunia.mp3"
+
+
+class LetterModel:
+    # Embeds texts by their counts of "a", "b" and "c" instead of a real model
+    def encode(self, texts, normalize_embeddings=True):
+        vectors = np.array(
+            [[text.count(letter) for letter in "abc"] for text in texts], dtype=np.float32
+        )
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class WordEncoding:
+    # Counts words as tokens so tests never download the tiktoken vocabulary
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+class ThreadPool(ThreadPoolExecutor):
+    # Stands in for the spawn process pool, which cannot run patched functions
+    def __init__(self, max_workers=None, mp_context=None):
+        super().__init__(max_workers)
+
+
 class TestAudioProcessing(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        # The Whisper model is only loaded by the tests that need it
+        cls.stt = None
+
+    def load_stt(self):
+        # Check the sample and the flag first so a skipped test never loads the model
+        if not os.path.exists(audio_file_path):
+            self.skipTest("No sample audio file found.")
+        if os.environ.get("SKIP_WHISPER_TESTS"):
+            self.skipTest("Whisper tests disabled by SKIP_WHISPER_TESTS.")
+
+        # A configured transcription server keeps the model loaded instead
+        if not app.stt_url and type(self).stt is None:
+            type(self).stt = app.get_stt()
+
     def test_get_llm_response(self):
         # Mock the completion function to return a dummy response
-        with patch('litellm.completion') as mock_completion:
-            mock_completion.return_value = MagicMock(choices=[MagicMock(message=MagicMock(content='Dummy response'))])
+        async def stream():
+            for content in ['Dummy ', 'response']:
+                yield MagicMock(choices=[MagicMock(delta=MagicMock(content=content))])
+
+        # Stub the cache and tokenizer so no model is loaded and nothing is written
+        with patch('app.acompletion', new_callable=AsyncMock) as mock_completion, \
+                patch('app.llm_cache') as mock_cache, \
+                patch('app.get_encoding') as mock_encoding:
+            mock_completion.return_value = stream()
+            mock_cache.get.return_value = None
+            mock_encoding.return_value.encode.return_value = [0]
             text = "Test input text"
-            response = get_llm_response(text)
-            self.assertIsNotNone(response)
-            self.assertIsInstance(response, str)
+            response = asyncio.run(get_llm_response(text))
+            mock_completion.assert_awaited_once()
+            self.assertEqual(response, "Dummy response")
+
+    def test_stream_completion_retry(self):
+        # The first stream drops after one delta, the retry completes
+        async def dropped():
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content="Separuh "))])
+            raise app.litellm.APIConnectionError("dropped", "openrouter", "model")
+
+        async def complete():
+            for content in ["Ringkasan ", "lengkap"]:
+                yield MagicMock(choices=[MagicMock(delta=MagicMock(content=content))])
+
+        stream_to = io.StringIO()
+        stream_to.write("header\n")
+        with patch('app.acompletion', new_callable=AsyncMock) as mock_completion, \
+                patch.object(app.stream_completion.retry, "wait", wait_none()):
+            mock_completion.side_effect = [dropped(), complete()]
+            response = asyncio.run(
+                app.stream_completion([], stream_to=stream_to, offset=len("header\n"))
+            )
+
+        self.assertEqual(mock_completion.await_count, 2)
+        self.assertEqual(response, "Ringkasan lengkap")
+        # Only the retried attempt follows the header
+        self.assertEqual(stream_to.getvalue(), "header\nRingkasan lengkap")
+
+    def test_process_text_for_response(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch('app.get_llm_response', new_callable=AsyncMock) as mock_response:
+            mock_response.return_value = "ringkasan"
+            asyncio.run(app.process_text_for_response("teks", tmp))
+            asyncio.run(app.process_text_for_response("teks", tmp, "rapat"))
+            self.assertEqual(
+                sorted(os.listdir(tmp)), ["rapat_response.txt", "response.txt"]
+            )
+
+    def test_split_text(self):
+        # Long text is split into parts that each fit the token limit
+        text = " ".join(f"Ini adalah kalimat nomor {i}." for i in range(200))
+        with patch('app.get_encoding', return_value=WordEncoding()):
+            parts = split_text(text, 100)
+        self.assertGreater(len(parts), 1)
+        for part in parts:
+            self.assertLessEqual(len(WordEncoding().encode(part)), 100)
+        self.assertEqual(" ".join(parts), text)
+
+    def test_split_text_short(self):
+        # Texts with no more bytes than the limit never load the tokenizer
+        with patch('app.get_encoding') as mock_encoding:
+            self.assertEqual(split_text("Halo semua.", 100), ["Halo semua."])
+        mock_encoding.assert_not_called()
+
+    def test_load_audio_wav_with_extra_chunk(self):
+        # Write a 16 kHz mono PCM16 WAV with the standard library
+        samples = (np.sin(np.arange(16000) / 10) * 20000).astype("<i2")
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(16000)
+            f.writeframes(samples.tobytes())
+        data = buffer.getvalue()
+
+        # Insert an odd-sized chunk before "data", padded to an even size
+        extra = b"LIST" + (3).to_bytes(4, "little") + b"abc\x00"
+        riff_size = int.from_bytes(data[4:8], "little") + len(extra)
+        data = data[:4] + riff_size.to_bytes(4, "little") + data[8:36] + extra + data[36:]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "speech.wav")
+            with open(path, "wb") as f:
+                f.write(data)
+
+            self.assertEqual(audio.wav_data_offset(path), 36 + len(extra) + 8)
+            expected, _ = sf.read(path, dtype="float32")
+            np.testing.assert_array_equal(audio.load_audio(path), expected)
+
+    def semantic_cache(self, tmp, **kwargs):
+        cache = SemanticCache(path=os.path.join(tmp, "llm_cache.db"), **kwargs)
+        cache.model = LetterModel()
+        cache.index = faiss.IndexFlatIP(3)
+        return cache
+
+    def test_semantic_cache_exact(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = self.semantic_cache(tmp, namespace="model-a")
+            cache.add("aab", "ringkasan")
+            self.assertEqual(cache.get("aab"), "ringkasan")
+            # Without a threshold only identical texts match
+            self.assertIsNone(cache.get("aabb"))
+
+            # Another model or prompt never sees these responses
+            other = self.semantic_cache(tmp, namespace="model-b")
+            self.assertIsNone(other.get("aab"))
+
+    def test_semantic_cache_threshold(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = self.semantic_cache(tmp, threshold=0.95)
+            cache.add("aaaaaaaaaab", "ringkasan")
+            # Similar embedding and length
+            self.assertEqual(cache.get("aaaaaaaaaba"), "ringkasan")
+            # Different embedding
+            self.assertIsNone(cache.get("bbbbbbbbbba"))
+            # Same embedding but a much longer text
+            self.assertIsNone(cache.get("aaaaaaaaaab" * 3))
+
+    def test_result_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "call.wav")
+            with open(path, "wb") as f:
+                f.write(b"audio bytes")
+
+            cache = ResultCache(cache_dir=os.path.join(tmp, "cache"))
+            key = cache.key(path, "openrouter/deepseek/deepseek-r1-zero:free")
+            # Model ids are made safe for file names and change the key
+            self.assertNotIn("/", key)
+            self.assertNotIn(":", key)
+            self.assertNotEqual(key, cache.key(path, "azure_ai/DeepSeek-R1"))
+
+            self.assertIsNone(cache.get(key))
+            cache.put(key, "transkripsi", "ringkasan")
+            record = cache.get(key)
+            self.assertEqual(record["transcription"], "transkripsi")
+            self.assertEqual(record["response"], "ringkasan")
+
+    def test_log_timings(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "call.wav")
+            sf.write(path, np.zeros(16000, dtype=np.float32), 16000)
+            log_path = os.path.join(tmp, "timings.jsonl")
+
+            with patch.object(app, "timings_log", log_path):
+                app.log_timings(path, 1.23456, 0.5)
+                # An unreadable file is reported instead of raised
+                app.log_timings(os.path.join(tmp, "missing.wav"), 1.0, 1.0)
+
+            with open(log_path) as f:
+                records = [json.loads(line) for line in f]
+            self.assertEqual(len(records), 1)
+            self.assertEqual(records[0]["transcribe_s"], 1.235)
+            self.assertAlmostEqual(records[0]["audio_s"], 1.0, places=2)
+
+    def test_archive_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            archive_dir = os.path.join(tmp, "archive")
+            os.makedirs(archive_dir)
+            for name in ["call.wav", "call_1000.wav"]:
+                with open(os.path.join(archive_dir, name), "w") as f:
+                    f.write("earlier")
+
+            source = os.path.join(tmp, "call.wav")
+            with open(source, "w") as f:
+                f.write("latest")
+
+            # Names already in the archive fall back to timestamped names
+            with patch("app.time.time", return_value=1000):
+                app.archive_file(source, archive_dir)
+            with open(os.path.join(archive_dir, "call_1000_2.wav")) as f:
+                self.assertEqual(f.read(), "latest")
+            self.assertFalse(os.path.exists(source))
+
+            # A failed move leaves the source in place and no placeholder behind
+            source = os.path.join(tmp, "meeting.wav")
+            with open(source, "w") as f:
+                f.write("latest")
+            with patch("app.os.replace", side_effect=OSError), \
+                    patch("app.shutil.move", side_effect=OSError):
+                with self.assertRaises(OSError):
+                    app.archive_file(source, archive_dir)
+            self.assertTrue(os.path.exists(source))
+            self.assertEqual(
+                sorted(os.listdir(archive_dir)),
+                ["call.wav", "call_1000.wav", "call_1000_2.wav"],
+            )
+
+    def test_batch_writer(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            summary_path = os.path.join(tmp, "summary.txt")
+            with BatchWriter(
+                transcribe_dir=os.path.join(tmp, "transcribe"),
+                response_dir=os.path.join(tmp, "response"),
+                summary_path=summary_path,
+            ) as writer:
+                transcription_path, response_path = writer.write_pair(
+                    "call", "halo", "ringkasan", 1.5, 2.0
+                )
+                writer.record("call", 1.5, 2.0)
+
+            with open(transcription_path, encoding="utf-8") as f:
+                self.assertEqual(f.read(), transcription_header(1.5) + "halo")
+            with open(response_path, encoding="utf-8") as f:
+                self.assertEqual(f.read(), response_header(2.0) + "ringkasan")
+            with open(summary_path, encoding="utf-8") as f:
+                summary = f.read()
+            self.assertIn("File: call\n", summary)
+            self.assertTrue(summary.endswith("Total files processed: 1\n"))
+
+    def test_assign_segments(self):
+        # Three files starting at 0 s, 10 s and 25 s of the combined audio
+        offsets = [0.0, 10.0, 25.0]
+        segments = [
+            SimpleNamespace(start=0.0, end=4.0, text=" Halo"),
+            SimpleNamespace(start=5.0, end=9.5, text=" semua."),
+            SimpleNamespace(start=26.0, end=30.0, text=" Sampai jumpa."),
+        ]
+        self.assertEqual(
+            assign_segments(segments, offsets), ["Halo semua.", "", "Sampai jumpa."]
+        )
+
+    def test_transcribe_loaded_clip_timestamps(self):
+        # Two files of 2 s and 3 s with chunks in seconds from their own start
+        loaded = [
+            (np.zeros(2 * 16000, dtype=np.float32), [{"start": 0.5, "end": 1.5}]),
+            (np.zeros(3 * 16000, dtype=np.float32), [{"start": 0.0, "end": 2.5}]),
+        ]
+        segments = [
+            SimpleNamespace(start=0.5, end=1.5, text=" Halo"),
+            SimpleNamespace(start=2.0, end=4.5, text=" semua."),
+        ]
+        with patch('app.get_stt') as mock_get_stt:
+            mock_get_stt.return_value.transcribe.return_value = (segments, None)
+            texts = transcribe_loaded(loaded)
+
+        # faster-whisper 1.2 expects seconds in the combined audio, not samples
+        _, kwargs = mock_get_stt.return_value.transcribe.call_args
+        self.assertEqual(
+            kwargs["clip_timestamps"],
+            [{"start": 0.5, "end": 1.5}, {"start": 2.0, "end": 4.5}],
+        )
+        self.assertEqual(texts, ["Halo", "semua."])
+
+    def run_process_files(
+        self, files, load=None, transcribe_batch=None, files_per_batch=1, durations=None
+    ):
+        # Run process_files with stubbed caches, decoding, Whisper and LLM calls
+        events = []
+        processed = []
+
+        def key(file_path, model):
+            events.append(("key", file_path))
+            return file_path
+
+        def loader():
+            def load_speech(file_path):
+                events.append(("load", file_path))
+                return load(file_path) if load else file_path
+            return load_speech
+
+        def run(items):
+            events.append(("transcribe", tuple(items)))
+            if transcribe_batch:
+                return transcribe_batch(items)
+            return [f"text of {item}" for item in items]
+
+        async def process(file_path, transcription, *args):
+            processed.append((file_path, transcription))
+
+        with patch('app.result_cache') as mock_cache, \
+                patch('app.ProcessPoolExecutor', ThreadPool), \
+                patch('app.speech_loader', loader), \
+                patch('app.transcribe_loaded', run), \
+                patch('app.warmup'), \
+                patch('app.get_stt'), \
+                patch('app.stt_url', None), \
+                patch('app.files_per_batch', files_per_batch), \
+                patch('app.batch_seconds', 100.0), \
+                patch('audio.get_duration', lambda path: (durations or {}).get(path, 10.0)), \
+                patch('app.process_audio_file', process), \
+                patch('app.archive_file'):
+            mock_cache.key.side_effect = key
+            mock_cache.get.return_value = None
+            asyncio.run(app.process_files(files, "archives", None))
+        return events, processed
+
+    def test_process_files_hashes_per_batch(self):
+        events, processed = self.run_process_files(["a", "b", "c"])
+        # The last file is hashed only after the first batch was transcribed
+        self.assertLess(
+            events.index(("transcribe", ("a",))), events.index(("key", "c"))
+        )
+        self.assertEqual(
+            processed, [("a", "text of a"), ("b", "text of b"), ("c", "text of c")]
+        )
+
+    def test_process_files_decode_failure(self):
+        def load(file_path):
+            if file_path == "bad":
+                raise ValueError("corrupt file")
+            return file_path
+
+        events, processed = self.run_process_files(
+            ["a", "bad", "c"], load=load, files_per_batch=3
+        )
+        # The file that failed to decode is left out; the rest stay batched
+        self.assertIn(("transcribe", ("a", "c")), events)
+        self.assertEqual(processed, [("a", "text of a"), ("c", "text of c")])
+
+    def test_process_files_batch_retry(self):
+        def transcribe_batch(items):
+            if len(items) > 1 or items[0] == "b":
+                raise RuntimeError("batch failed")
+            return [f"text of {items[0]}"]
+
+        events, processed = self.run_process_files(
+            ["a", "b", "c"], transcribe_batch=transcribe_batch, files_per_batch=3
+        )
+        # A failed batch is retried one file at a time
+        self.assertEqual(
+            [event for event in events if event[0] == "transcribe"],
+            [
+                ("transcribe", ("a", "b", "c")),
+                ("transcribe", ("a",)),
+                ("transcribe", ("b",)),
+                ("transcribe", ("c",)),
+            ],
+        )
+        self.assertEqual(processed, [("a", "text of a"), ("c", "text of c")])
+
+    def test_process_files_batch_seconds(self):
+        events, _ = self.run_process_files(
+            ["a", "b", "c"],
+            files_per_batch=8,
+            durations={"a": 60.0, "b": 30.0, "c": 30.0},
+        )
+        # Batches close before they would exceed batch_seconds
+        self.assertEqual(
+            [event for event in events if event[0] == "transcribe"],
+            [("transcribe", ("a", "b")), ("transcribe", ("c",))],
+        )
+
+    def test_compact_speech(self):
+        samples = np.arange(5 * 16000, dtype=np.float32)
+        chunks = [{"start": 1.0, "end": 2.0}, {"start": 3.0, "end": 3.5}]
+        speech, compact_chunks = audio.compact_speech(samples, chunks)
+        # Only the chunk samples are kept, back to back
+        np.testing.assert_array_equal(
+            speech, np.concatenate([samples[16000:32000], samples[48000:56000]])
+        )
+        self.assertEqual(
+            compact_chunks, [{"start": 0.0, "end": 1.0}, {"start": 1.0, "end": 1.5}]
+        )
+
+    def test_transcribe_sends_vad_to_server(self):
+        with patch('app.stt_url', "http://127.0.0.1:8000"), \
+                patch('app.use_vad', False), \
+                patch('app.httpx.post') as mock_post:
+            mock_post.return_value.json.return_value = {"transcriptions": ["halo"]}
+            self.assertEqual(transcribe(["call.wav"]), ["halo"])
+
+        # --no-vad reaches the server instead of its own VAD setting
+        _, kwargs = mock_post.call_args
+        self.assertEqual(kwargs["json"]["paths"], [os.path.abspath("call.wav")])
+        self.assertFalse(kwargs["json"]["vad"])
 
     def test_transcribe(self):
-        # Use a sample audio file for testing
-        audio_file_path = "sample/Podcast-Terpendek-di-Dunia.mp3"
-        if os.path.exists(audio_file_path):
-            transcription = transcribe(audio_file_path)
-            self.assertIsNotNone(transcription)
-            self.assertIsInstance(transcription, str)
-        else:
-            self.skipTest("No sample audio file found.")
+        self.load_stt()
+        transcriptions = transcribe([audio_file_path])
+        self.assertEqual(len(transcriptions), 1)
+        self.assertIsInstance(transcriptions[0], str)
 
     def test_process_audio_file(self):
-        # Use a sample audio file for testing
-        audio_file_path = "sample/Podcast-Terpendek-di-Dunia.mp3"
-        if os.path.exists(audio_file_path):
-            process_audio_file(audio_file_path)
-            # Check if output files are created
-            base_name = os.path.splitext(os.path.basename(audio_file_path))[0]
-            transcription_path = os.path.join("transcribe", f"{base_name}_transcription.txt")
-            response_path = os.path.join("response", f"{base_name}_response.txt")
-            self.assertTrue(os.path.exists(transcription_path))
-            self.assertTrue(os.path.exists(response_path))
-        else:
-            self.skipTest("No sample audio file found.")
+        self.load_stt()
+        asyncio.run(process_audio_file(audio_file_path))
+        # Check if output files are created
+        base_name = os.path.splitext(os.path.basename(audio_file_path))[0]
+        transcription_path = os.path.join("transcribe", f"{base_name}_transcription.txt")
+        response_path = os.path.join("response", f"{base_name}_response.txt")
+        self.assertTrue(os.path.exists(transcription_path))
+        self.assertTrue(os.path.exists(response_path))
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,170 @@
+import os
+import time
+
+
+def transcription_header(transcription_time: float) -> str:
+    """
+    Formats the timing line written at the top of a transcription file.
+
+    Args:
+        transcription_time (float): Time spent transcribing, in seconds.
+
+    Returns:
+        str: The header line.
+    """
+    return f"Transcription Time: {transcription_time:.2f} seconds\n"
+
+
+def response_header(response_time: float) -> str:
+    """
+    Formats the timing line written at the top of a response file.
+
+    The time is padded to a fixed width so the header of a streamed response
+    can be rewritten in place once generation finishes.
+
+    Args:
+        response_time (float): Time spent generating the response, in seconds.
+
+    Returns:
+        str: The header line.
+    """
+    return f"Response Generation Time: {response_time:8.2f} seconds\n"
+
+
+def write_file(path: str, text: str):
+    """
+    Writes text to a file with raw os.write calls, bypassing Python's text layer.
+
+    Args:
+        path (str): Path to the file.
+        text (str): The text to write.
+    """
+    data = memoryview(text.encode("utf-8"))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while data:
+            data = data[os.write(fd, data) :]
+    finally:
+        os.close(fd)
+
+
+class BatchWriter:
+    def __init__(
+        self,
+        transcribe_dir: str = "transcribe",
+        response_dir: str = "response",
+        summary_path: str = None,
+    ):
+        """
+        Initializes the BatchWriter class.
+
+        Owns the output directories and a single buffered summary file that
+        stays open for the whole run. Use it as a context manager.
+
+        Args:
+            transcribe_dir (str, optional): Directory for transcription files. Defaults to "transcribe".
+            response_dir (str, optional): Directory for response files. Defaults to "response".
+            summary_path (str, optional): Path of the run summary file. No summary is written if omitted.
+        """
+        self.transcribe_dir = transcribe_dir
+        self.response_dir = response_dir
+        self.summary_path = summary_path
+        self.summary = None
+        self.count = 0
+
+    def __enter__(self):
+        os.makedirs(self.transcribe_dir, exist_ok=True)
+        os.makedirs(self.response_dir, exist_ok=True)
+
+        if self.summary_path:
+            self.summary = open(
+                self.summary_path, "w", buffering=1 << 20, encoding="utf-8"
+            )
+            self.summary.write("Audio processing summary\n")
+            self.summary.write(
+                f"Processed at: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+            )
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.summary is not None:
+            self.summary.write(f"Total files processed: {self.count}\n")
+            self.summary.close()
+            self.summary = None
+
+    def transcription_path(self, base_name: str) -> str:
+        """
+        Returns the path of the transcription file for the given base name.
+        """
+        return os.path.join(self.transcribe_dir, f"{base_name}_transcription.txt")
+
+    def response_path(self, base_name: str) -> str:
+        """
+        Returns the path of the response file for the given base name.
+        """
+        return os.path.join(self.response_dir, f"{base_name}_response.txt")
+
+    def write_transcription(
+        self, base_name: str, transcription: str, transcription_time: float
+    ) -> str:
+        """
+        Writes a transcription file with its timing header.
+
+        Args:
+            base_name (str): Name of the audio file without extension.
+            transcription (str): The transcribed text.
+            transcription_time (float): Time spent transcribing, in seconds.
+
+        Returns:
+            str: Path of the written file.
+        """
+        path = self.transcription_path(base_name)
+        write_file(path, transcription_header(transcription_time) + transcription)
+        return path
+
+    def write_pair(
+        self,
+        base_name: str,
+        transcription: str,
+        response: str,
+        transcription_time: float = 0.0,
+        response_time: float = 0.0,
+    ) -> tuple:
+        """
+        Writes the transcription and response files of one audio file.
+
+        Args:
+            base_name (str): Name of the audio file without extension.
+            transcription (str): The transcribed text.
+            response (str): The LLM response.
+            transcription_time (float, optional): Time spent transcribing, in seconds. Defaults to 0.
+            response_time (float, optional): Time spent generating the response, in seconds. Defaults to 0.
+
+        Returns:
+            tuple: Paths of the transcription and response files.
+        """
+        transcription_path = self.write_transcription(
+            base_name, transcription, transcription_time
+        )
+        response_path = self.response_path(base_name)
+        write_file(response_path, response_header(response_time) + response)
+        return transcription_path, response_path
+
+    def record(self, base_name: str, transcription_time: float, response_time: float):
+        """
+        Adds a processed file to the run summary.
+
+        Args:
+            base_name (str): Name of the audio file without extension.
+            transcription_time (float): Time spent transcribing, in seconds.
+            response_time (float): Time spent generating the response, in seconds.
+        """
+        self.count += 1
+        if self.summary is not None:
+            self.summary.write(f"File: {base_name}\n")
+            self.summary.write(
+                f"Transcription Time: {transcription_time:.2f} seconds\n"
+            )
+            self.summary.write(
+                f"Response Generation Time: {response_time:.2f} seconds\n\n"
+            )